@@ -4,8 +4,7 @@
 演示如何使用parse_qwen_response函数解析通义千问API返回的响应数据
 """
 
-import json
-from qwen_api import parse_qwen_response
+from qwen_api import parse_qwen_response, load_dict_literal
 
 # 示例1: 字符串形式的API响应
 example_response_str = '''
@@ -97,9 +96,8 @@ def main():
         json_str = user_response.split("需要解析text")[0].strip()
         
         try:
-            # 使用eval安全地将Python字典字符串转换为实际字典
-            # (eval比直接替换单引号为双引号更可靠)
-            user_dict = eval(json_str)
+            # 将Python字典字符串转换为实际字典
+            user_dict = load_dict_literal(json_str)
             text4 = parse_qwen_response(user_dict)
             print("提取的文本:")
             print(text4)
@@ -139,8 +137,8 @@ def parse_api_response_with_suffix(response_text):
         json_str = response_text.split("需要解析text")[0].strip()
         
         try:
-            # 使用eval将Python字典字符串转换为字典对象
-            parsed_dict = eval(json_str)
+            # 将Python字典字符串转换为字典对象
+            parsed_dict = load_dict_literal(json_str)
             return parse_qwen_response(parsed_dict)
         except Exception as e:
             print(f"警告: 解析响应时出错: {e}")
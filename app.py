@@ -7,14 +7,17 @@
 import os
 import io
 import time
-from PIL import Image
+from PIL import Image, ImageOps
 import streamlit as st
-from dotenv import load_dotenv
-import textwrap
+import numpy as np
 import json
+import logging
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 导入自定义模块
-from qwen_api import QwenAPI, analyze_description, TASK_TYPES, parse_qwen_response
+from qwen_api import QwenAPI, analyze_description, parse_qwen_response
 from food_calories import get_food_calories, get_similar_foods
 from product_search import generate_purchase_links, is_likely_product
 from image_generator import (
@@ -22,8 +25,122 @@ from image_generator import (
     get_aspect_ratios, get_prompt_enhancers
 )
 
-# 加载环境变量
-load_dotenv()
+# 日志级别可通过环境变量LOG_LEVEL调整（如DEBUG）；根日志器已配置时basicConfig不会重复配置
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# 食物查询只取决于名称，用st.cache_data缓存以避免重复的模糊匹配
+# （app.py在每次重新运行时都会重新执行，缓存必须放在Streamlit的缓存中才能跨运行保留）
+get_food_calories = st.cache_data(ttl=3600, show_spinner=False, max_entries=512)(get_food_calories)
+get_similar_foods = st.cache_data(ttl=3600, show_spinner=False, max_entries=256)(get_similar_foods)
+
+# 同一描述在重新运行时会被重复分析，按描述文本缓存分析结果
+analyze_description = st.cache_data(show_spinner=False, max_entries=256)(analyze_description)
+
+# 并发调用API的最大线程数（最多6个分析任务）
+MAX_ANALYSIS_WORKERS = 6
+
+# 是否将多个任务合并为一次请求（可通过环境变量QWEN_MULTI_TASK_BATCH=1开启）。
+# 合并请求只有在模型输出全部生成后才能判断能否解析，失败时还要再逐个请求，且多个长文本串行生成，
+# 因此默认并发逐个请求；API调用额度紧张时可开启以节省图片token
+MULTI_TASK_BATCH = os.getenv("QWEN_MULTI_TASK_BATCH", "0") == "1"
+
+# 图像分析任务选项
+TASK_OPTIONS = {
+    "识别": "📋 图像识别与描述",
+    "作文": "📝 看图写作文",
+    "解题": "🧮 看图解题",
+    "故事": "📚 生成故事",
+    "诗歌": "🎭 创作诗歌",
+    "科普": "🔬 科普解释"
+}
+
+# 各任务自定义提示输入框的(标签, 占位文字)，在导入时一次性生成
+CUSTOM_PROMPT_FIELDS = {
+    task: (f"{label}的自定义提示", f"输入自定义的{label}提示...")
+    for task, label in TASK_OPTIONS.items()
+}
+
+# 文本类任务结果的显示方式: 任务 -> (标题, 外层样式类, 内容样式类, 下载文件名, 下载按钮文字)
+TEXT_RESULT_SECTIONS = {
+    "作文": ("📝 看图写作文", "result-box", "essay-content", "看图作文.txt", "下载作文"),
+    "解题": ("🧮 看图解题", "result-box", "problem-solution", "题目解答.txt", "下载解答"),
+    "故事": ("📚 生成故事", "result-box creative-section", "essay-content", "生成故事.txt", "下载故事"),
+    "诗歌": ("🎭 创作诗歌", "result-box creative-section", "essay-content", "创作诗歌.txt", "下载诗歌"),
+    "科普": ("🔬 科普解释", "result-box creative-section", "essay-content", "科普解释.txt", "下载科普")
+}
+
+# 图像风格按侧边栏的三组单选框预先切分，质量、比例和增强器选项预先取出名称列表
+STYLE_NAMES = list(get_available_styles().keys())
+BASIC_STYLE_NAMES = STYLE_NAMES[:5]
+ART_STYLE_NAMES = STYLE_NAMES[5:10]
+SPECIAL_STYLE_NAMES = STYLE_NAMES[10:]
+QUALITY_NAMES = list(get_quality_options().keys())
+RATIO_NAMES = list(get_aspect_ratios().keys())
+ENHANCER_NAMES = list(get_prompt_enhancers().keys())
+
+# 侧边栏的静态文本，相邻的文本合并为一次输出
+SIDEBAR_ABOUT_MD = """
+---
+### 关于
+"""
+SIDEBAR_VERSION_MD = "**版本**: v1.0.0  \n**更新时间**: 2023年12月"
+
+# 页面底部“使用说明”和“API设置”的静态文本
+HELP_MD = """
+## 功能介绍
+
+### 图像分析功能
+- **图像识别与描述**: 识别并详细描述图像内容，包括食物热量和商品信息
+- **看图写作文**: 根据图像内容自动生成不少于300字的作文
+- **看图解题**: 识别图像中的题目并给出详细解答
+- **创意内容生成**: 可生成与图像相关的故事、诗歌或科普解释
+
+### AI绘画功能
+- **文本生成图像**: 根据文字描述生成图像，支持15种艺术风格
+- **图像变体生成**: 基于上传的图像创建不同风格的变体
+- **多样风格**: 从写实、油画、水彩到二次元、赛博朋克等多种风格
+- **质量选择**: 支持标准、高清、超清多种分辨率
+
+## 使用技巧
+1. 在进行图像分析时，可以同时选择多个任务一次性完成
+2. 生成图像时，尝试添加详细的描述和风格，会得到更好的效果
+3. 使用自定义提示来引导AI生成更符合期望的内容
+4. 高级选项中的负面提示词可以帮助排除不需要的元素
+"""
+API_SETTINGS_MD = """
+### API密钥设置
+
+本应用使用两个API：
+1. **通义千问API**: 用于图像识别、作文生成和解题
+2. **Stability AI API**: 用于AI图像生成
+
+#### 设置方法：
+1. 创建一个`.env`文件在应用根目录
+2. 添加以下内容：
+   ```
+   QWEN_API_KEY=你的通义千问API密钥
+   STABILITY_API_KEY=你的Stability AI API密钥
+   ```
+3. 如果没有Stability API密钥，应用将使用模拟模式生成图像
+
+#### 获取API密钥：
+- 通义千问API密钥: [阿里云通义平台](https://dashscope.aliyun.com/)
+- Stability AI API密钥: [Stability AI官网](https://stability.ai/)
+"""
+
+# 图像历史记录默认显示的条数
+HISTORY_PREVIEW_COUNT = 3
+
+# 页面预览图的最大边长
+PREVIEW_MAX_SIZE = 1024
+
+# 提交给API的图片最大边长，超过时缩小并重新编码为JPEG，减少上传和base64编码的数据量
+API_IMAGE_MAX_SIZE = 2048
+API_JPEG_QUALITY = 85
 
 # 页面配置必须是第一个st命令
 st.set_page_config(
@@ -37,39 +154,218 @@ st.set_page_config(
 )
 
 # 应用默认样式
-st.markdown(
+APP_CSS = """
+<style>
+.stApp {
+    background-color: #FFFFFF;
+    color: #424242;
+}
+.stButton button {
+    background-color: #1E88E5;
+    color: white;
+}
+.stTextInput input, .stTextArea textarea {
+    border-color: #1E88E5;
+}
+.stSelectbox, .stMultiselect {
+    border-color: #1E88E5;
+}
+h1, h2, h3, h4, h5, h6 {
+    color: #1E88E5;
+    font-family: sans-serif;
+}
+.stMarkdown {
+    font-family: sans-serif;
+}
+</style>
+"""
+
+@st.cache_resource
+def inject_css():
+    """注入应用样式（缓存后重新运行时直接回放，不再重复构建样式块）"""
+    # st.html 直接插入HTML，跳过Markdown解析
+    st.html(APP_CSS)
+    return True
+
+def make_preview(image, max_size=PREVIEW_MAX_SIZE):
+    """生成用于页面显示的缩略图，原图保持不变"""
+    preview = image.copy()
+    preview.thumbnail((max_size, max_size), Image.LANCZOS)
+    return preview
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def decode_preview(raw):
     """
-    <style>
-    .stApp {
-        background-color: #FFFFFF;
-        color: #424242;
-    }
-    .stButton button {
-        background-color: #1E88E5;
+    解码上传的图片并生成缩略图数组，按图片字节缓存，复选框等交互引发的重新运行不再重复解码
+    
+    参数:
+        raw (bytes): 上传图片的原始字节
+        
+    返回:
+        numpy.ndarray: 可直接传给st.image的缩略图像素数组
+    """
+    # 像素数组不带EXIF，先按EXIF方向信息旋转，与浏览器直接显示原图时的方向一致
+    preview = make_preview(ImageOps.exif_transpose(Image.open(io.BytesIO(raw))))
+    if preview.mode not in ("RGB", "RGBA", "L"):
+        preview = preview.convert("RGB")
+    return np.asarray(preview)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def prepare_api_image(raw):
+    """
+    准备提交给API的图片字节：尺寸不超过API_IMAGE_MAX_SIZE时原样返回，不重新编码；
+    否则缩小后以JPEG重新编码
+    
+    参数:
+        raw (bytes): 上传图片的原始字节
+        
+    返回:
+        bytes: 提交给API的图片字节
+    """
+    image = Image.open(io.BytesIO(raw))
+    if max(image.size) <= API_IMAGE_MAX_SIZE:
+        return raw
+    
+    # 重新编码不保留EXIF，先按EXIF方向信息旋转，避免手机照片以横倒的方向提交
+    resized = make_preview(ImageOps.exif_transpose(image), max_size=API_IMAGE_MAX_SIZE)
+    if resized.mode != "RGB":
+        resized = resized.convert("RGB")
+    buffer = io.BytesIO()
+    resized.save(buffer, format="JPEG", quality=API_JPEG_QUALITY)
+    return buffer.getvalue()
+
+def ratio_block_html(ratio_name):
+    """
+    生成表示图像比例的彩色示意块HTML
+    
+    参数:
+        ratio_name (str): 比例名称，如"1:1 方形"
+        
+    返回:
+        str: 示意块的HTML
+    """
+    ratio_info = get_aspect_ratios()[ratio_name]
+    width_ratio = ratio_info["width_ratio"]
+    height_ratio = ratio_info["height_ratio"]
+    
+    # 计算示例框的大小，确保适合显示
+    scale = 100 / max(width_ratio, height_ratio)
+    display_width = int(width_ratio * scale)
+    display_height = int(height_ratio * scale)
+    
+    return f"""
+    <div style="
+        width: {display_width}px; 
+        height: {display_height}px; 
+        background-color: var(--primary-color); 
+        margin: 10px auto;
+        border-radius: 5px;
+        display: flex;
+        align-items: center;
+        justify-content: center;
         color: white;
-    }
-    .stTextInput input, .stTextArea textarea {
-        border-color: #1E88E5;
-    }
-    .stSelectbox, .stMultiselect {
-        border-color: #1E88E5;
-    }
-    h1, h2, h3, h4, h5, h6 {
-        color: #1E88E5;
-        font-family: sans-serif;
-    }
-    .stMarkdown {
-        font-family: sans-serif;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+        font-weight: bold;
+    ">
+    {ratio_name}
+    </div>
+    """
 
-def save_text_as_file(text, filename):
-    """保存文本为文件"""
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(text)
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
+def render_products_markdown(products):
+    """
+    生成商品购买链接区块的Markdown，标题、商品名称和各平台链接合并为一次输出
+    
+    参数:
+        products (tuple): 商品名称元组
+        
+    返回:
+        str: 商品区块的Markdown文本
+    """
+    product_md = ["#### 🛒 商品购买链接"]
+    for product in products:
+        links = generate_purchase_links(product)
+        product_md.append("  \n".join(
+            [f"**{product}**"] + [f"[{platform}]({link})" for platform, link in links.items()]
+        ))
+    return "\n\n".join(product_md)
+
+@st.cache_resource
+def get_qwen_api():
+    """获取共享的通义千问API客户端（跨重新运行和会话复用，保留HTTP连接池）"""
+    return QwenAPI()
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def cached_process_image_request(image_digest, task, custom_prompt, _image_data):
+    """
+    按(图像摘要, 任务, 自定义提示)缓存API请求结果
+    
+    参数:
+        image_digest (str): 图像内容的摘要，作为缓存键
+        task (str): 任务类型
+        custom_prompt (str): 自定义提示，为空时使用默认提示
+        _image_data (bytes): 图像二进制数据（以下划线开头，不参与缓存键计算）
+        
+    返回:
+        dict: API返回的处理结果
+    """
+    result = get_qwen_api().process_image_request(
+        image_data=_image_data,
+        task_type=task,
+        custom_prompt=custom_prompt
+    )
+    
+    # 失败或无法解析的响应以异常抛出，避免被写入缓存
+    if isinstance(result, dict) and "error" in result:
+        raise RuntimeError(result["error"])
+    text = parse_qwen_response(result)
+    if text.startswith("无法解析") or text.startswith("错误"):
+        raise RuntimeError(text)
+    return result
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def cached_process_image_multi(image_digest, tasks, custom_prompts, _image_data):
+    """
+    按(图像摘要, 任务组合, 自定义提示)缓存多任务合并请求的结果
+    
+    参数:
+        image_digest (str): 图像内容的摘要，作为缓存键
+        tasks (tuple): 任务类型元组
+        custom_prompts (tuple): 与tasks一一对应的自定义提示，为空时使用默认提示
+        _image_data (bytes): 图像二进制数据（以下划线开头，不参与缓存键计算）
+        
+    返回:
+        dict: 任务类型到结果文本的映射
+    """
+    result = get_qwen_api().process_image_multi(
+        list(tasks),
+        image_data=_image_data,
+        custom_prompts=dict(zip(tasks, custom_prompts))
+    )
+    
+    # 合并请求失败或响应无法解析时抛出异常，避免被写入缓存
+    if result is None:
+        raise RuntimeError("多任务合并请求的响应无法解析")
+    return result
+
+@st.cache_resource
+def get_image_generator():
+    """获取共享的图像生成器实例"""
+    return ImageGenerator()
+
+@st.cache_resource(max_entries=64)
+def _read_image_bytes(path, mtime):
+    """按(路径, 修改时间)缓存读取的图像文件内容"""
+    with open(path, "rb") as f:
+        return f.read()
+
+def load_image_bytes(path):
+    """
+    读取图像文件内容
+    
+    固定种子在同一秒内重复生成时文件名相同、文件会被覆盖，旧文件也可能被清理后重新写入，
+    因此缓存键包含文件的修改时间，文件变化后自动重新读取
+    """
+    return _read_image_bytes(path, os.path.getmtime(path))
 
 def download_button(text, filename, button_text):
     """创建下载按钮"""
@@ -78,17 +374,14 @@ def download_button(text, filename, button_text):
         text_str = json.dumps(text, ensure_ascii=False, indent=2)
     else:
         text_str = str(text)
-        
-    with open("temp.txt", "w", encoding="utf-8") as f:
-        f.write(text_str)
-    with open("temp.txt", "r", encoding="utf-8") as f:
-        st.download_button(
-            label=button_text,
-            data=f,
-            file_name=filename,
-            mime="text/plain"
-        )
-    os.remove("temp.txt")
+    
+    # 直接传入内存中的字节，无需写入临时文件
+    st.download_button(
+        label=button_text,
+        data=text_str.encode("utf-8"),
+        file_name=filename,
+        mime="text/plain"
+    )
 
 def handle_api_response(response_data, default_message="无法解析响应"):
     """
@@ -107,17 +400,53 @@ def handle_api_response(response_data, default_message="无法解析响应"):
         
         # 如果结果以"无法解析"或"错误"开头，记录原始响应并返回默认消息
         if result.startswith("无法解析") or result.startswith("错误"):
-            print(f"API响应解析失败: {result}")
-            print(f"原始响应: {json.dumps(response_data, ensure_ascii=False)[:1000]}...")
+            logger.warning("API响应解析失败: %s", result)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("原始响应: %s...", json.dumps(response_data, ensure_ascii=False)[:1000])
             return default_message
             
         return result
     except Exception as e:
-        print(f"处理API响应时出错: {str(e)}")
-        print(f"原始响应: {str(response_data)[:1000]}...")
+        logger.error("处理API响应时出错: %s", e)
+        logger.debug("原始响应: %.1000s...", response_data)
         return default_message
 
+# 按钮回调：Streamlit在执行回调后只重新运行一次脚本，无需再手动触发重新运行；
+# 回调在控件创建之前执行，因此也可以修改文本框等控件绑定的会话状态
+def open_contact():
+    """显示联系作者对话框"""
+    st.session_state["show_contact"] = True
+
+def close_contact():
+    """关闭联系作者对话框"""
+    st.session_state["show_contact"] = False
+
+def clear_image_history():
+    """清除图像历史记录"""
+    st.session_state["image_history"] = []
+
+def reuse_history_settings(hist_item):
+    """
+    将历史记录中的提示词和风格设为当前设置
+    
+    参数:
+        hist_item (dict): 图像历史记录项
+    """
+    st.session_state["text_prompt"] = hist_item["prompt"]
+    if "style" in hist_item:
+        # 找到对应的风格区域并设置
+        style_name = hist_item["style"]
+        if style_name in BASIC_STYLE_NAMES:
+            st.session_state["last_used_style_section"] = "basic"
+        elif style_name in ART_STYLE_NAMES:
+            st.session_state["last_used_style_section"] = "art"
+        else:
+            st.session_state["last_used_style_section"] = "special"
+
 def main():
+    # 应用样式
+    inject_css()
+    
     # 标题和介绍
     st.markdown('<h1 class="main-title">通义千问视觉智能助手</h1>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">基于通义千问视觉语言模型的多功能AI助手，支持图像分析、作文生成、解题辅助和AI绘画</p>', unsafe_allow_html=True)
@@ -126,8 +455,7 @@ def main():
     with st.container():
         cols = st.columns([5, 1])
         with cols[1]:
-            if st.button("📞 联系作者", key="contact_button"):
-                st.session_state["show_contact"] = True
+            st.button("📞 联系作者", key="contact_button", on_click=open_contact)
     
     # 创建侧边栏选择功能区
     with st.sidebar:
@@ -137,31 +465,29 @@ def main():
         tab_analysis, tab_generation = st.tabs(["📸 图像分析", "🎨 图像生成"])
         
         with tab_analysis:
-            # 图像分析任务选择
-            task_options = {
-                "识别": "📋 图像识别与描述",
-                "作文": "📝 看图写作文",
-                "解题": "🧮 看图解题",
-                "故事": "📚 生成故事",
-                "诗歌": "🎭 创作诗歌",
-                "科普": "🔬 科普解释"
-            }
-            
-            selected_tasks = []
+            # 图像分析任务选择（单个多选控件代替每个任务一个复选框）
             st.write("### 选择任务")
-            for task_key, task_label in task_options.items():
-                if st.checkbox(task_label, key=f"task_{task_key}"):
-                    selected_tasks.append(task_key)
+            chosen_tasks = st.multiselect(
+                "选择任务",
+                options=list(TASK_OPTIONS),
+                format_func=TASK_OPTIONS.get,
+                key="selected_tasks",
+                label_visibility="collapsed"
+            )
+            # 按TASK_OPTIONS的顺序排列，与选择的先后无关
+            selected_tasks = [task for task in TASK_OPTIONS if task in chosen_tasks]
                     
-            # 自定义提示选项
-            st.markdown("### 自定义提示 (可选)")
+            # 自定义提示选项，只为已选择的任务显示，默认折叠
             custom_prompt = {}
-            for task in selected_tasks:
-                custom_prompt[task] = st.text_area(
-                    f"{task_options[task]}的自定义提示", 
-                    key=f"prompt_{task}",
-                    placeholder=f"输入自定义的{task_options[task]}提示..."
-                )
+            if selected_tasks:
+                with st.expander("自定义提示 (可选)", expanded=False):
+                    for task in selected_tasks:
+                        prompt_label, prompt_placeholder = CUSTOM_PROMPT_FIELDS[task]
+                        custom_prompt[task] = st.text_area(
+                            prompt_label, 
+                            key=f"prompt_{task}",
+                            placeholder=prompt_placeholder
+                        )
                 
             st.markdown("### 上传图片")
             uploaded_file = st.file_uploader("选择一张图片...", type=["jpg", "jpeg", "png"])
@@ -210,13 +536,12 @@ def main():
                     
                     # 获取可用的提示词增强器
                     enhancers = get_prompt_enhancers()
-                    enhancer_names = list(enhancers.keys())
                     
                     # 创建多列布局显示增强器选项
                     enhancer_cols = st.columns(3)
                     selected_enhancers = []
                     
-                    for i, enhancer_name in enumerate(enhancer_names):
+                    for i, enhancer_name in enumerate(ENHANCER_NAMES):
                         col_idx = i % 3
                         with enhancer_cols[col_idx]:
                             if st.checkbox(enhancer_name, key=f"enhancer_{enhancer_name}"):
@@ -226,9 +551,7 @@ def main():
                         st.success(f"已选择 {len(selected_enhancers)} 个增强器")
                         
                         # 显示增强后的提示词预览
-                        preview_prompt = text_prompt
-                        for enhancer in selected_enhancers:
-                            preview_prompt += f", {enhancers[enhancer]}"
+                        preview_prompt = ", ".join([text_prompt] + [enhancers[enhancer] for enhancer in selected_enhancers])
                         
                         st.write("**增强后的提示词预览:**")
                         st.code(preview_prompt)
@@ -240,7 +563,6 @@ def main():
                 
                 # 获取可用的比例选项
                 aspect_ratios = get_aspect_ratios()
-                ratio_options = list(aspect_ratios.keys())
                 
                 # 图像比例选择
                 aspect_col1, aspect_col2 = st.columns([3, 2])
@@ -248,7 +570,7 @@ def main():
                 with aspect_col1:
                     selected_ratio = st.select_slider(
                         "选择图像比例",
-                        options=ratio_options,
+                        options=RATIO_NAMES,
                         value="1:1 方形"
                     )
                 
@@ -258,70 +580,36 @@ def main():
                         st.info(aspect_ratios[selected_ratio]["description"])
                         
                         # 显示比例示意图
-                        ratio_info = aspect_ratios[selected_ratio]
-                        width_ratio = ratio_info["width_ratio"]
-                        height_ratio = ratio_info["height_ratio"]
-                        
-                        # 计算示例框的大小，确保适合显示
-                        scale = 100 / max(width_ratio, height_ratio)
-                        display_width = int(width_ratio * scale)
-                        display_height = int(height_ratio * scale)
-                        
-                        # 创建一个彩色块表示比例
-                        st.markdown(
-                            f"""
-                            <div style="
-                                width: {display_width}px; 
-                                height: {display_height}px; 
-                                background-color: var(--primary-color); 
-                                margin: 10px auto;
-                                border-radius: 5px;
-                                display: flex;
-                                align-items: center;
-                                justify-content: center;
-                                color: white;
-                                font-weight: bold;
-                            ">
-                            {selected_ratio}
-                            </div>
-                            """, 
-                            unsafe_allow_html=True
-                        )
+                        st.markdown(ratio_block_html(selected_ratio), unsafe_allow_html=True)
                 
                 # 选择图像风格
-                styles = get_available_styles()
-                style_names = list(styles.keys())
-                
                 st.write("### 选择图像风格")
                 style_col1, style_col2, style_col3 = st.columns(3)
                 
                 with style_col1:
                     selected_style = st.radio(
                         "基础风格",
-                        options=style_names[:5],
+                        options=BASIC_STYLE_NAMES,
                         key="style_basic"
                     )
                     
                 with style_col2:
                     selected_style2 = st.radio(
                         "艺术风格",
-                        options=style_names[5:10],
+                        options=ART_STYLE_NAMES,
                         key="style_art"
                     )
                     
                 with style_col3:
                     selected_style3 = st.radio(
                         "特殊风格",
-                        options=style_names[10:],
+                        options=SPECIAL_STYLE_NAMES,
                         key="style_special"
                     )
                 
                 # 确定最终选择的风格
-                final_style = selected_style
-                if st.session_state.get("last_used_style_section") == "art":
-                    final_style = selected_style2
-                elif st.session_state.get("last_used_style_section") == "special":
-                    final_style = selected_style3
+                style_by_section = {"basic": selected_style, "art": selected_style2, "special": selected_style3}
+                final_style = style_by_section.get(st.session_state.get("last_used_style_section"), selected_style)
                     
                 # 更新最后使用的风格部分
                 # 使用按钮或检查当前选择的值来确定最后使用的风格部分
@@ -329,22 +617,19 @@ def main():
                 st_art = st.button("使用此艺术风格", key="use_art_style")
                 st_special = st.button("使用此特殊风格", key="use_special_style")
                 
-                if st_basic:
-                    st.session_state["last_used_style_section"] = "basic"
-                    final_style = selected_style
-                elif st_art:
-                    st.session_state["last_used_style_section"] = "art"
-                    final_style = selected_style2
-                elif st_special:
-                    st.session_state["last_used_style_section"] = "special"
-                    final_style = selected_style3
+                clicked_section = next(
+                    (section for section, clicked in (("basic", st_basic), ("art", st_art), ("special", st_special)) if clicked),
+                    None
+                )
+                if clicked_section:
+                    st.session_state["last_used_style_section"] = clicked_section
+                    final_style = style_by_section[clicked_section]
                 
                 # 质量选择
                 st.write("### 图像质量")
-                quality_options = get_quality_options()
                 selected_quality = st.select_slider(
                     "选择质量",
-                    options=list(quality_options.keys()),
+                    options=QUALITY_NAMES,
                     value="标准"
                 )
                 
@@ -375,34 +660,28 @@ def main():
                     if not st.session_state["image_history"]:
                         st.info("暂无历史记录。生成新图像后将显示在这里。")
                     else:
+                        # 默认只显示最近的几条记录；展开器即使折叠也会渲染内容，
+                        # 其余记录只在勾选后才读取和发送缩略图
+                        image_history = st.session_state["image_history"]
+                        visible_history = image_history[:HISTORY_PREVIEW_COUNT]
+                        if len(image_history) > HISTORY_PREVIEW_COUNT:
+                            if st.checkbox(f"显示全部{len(image_history)}条记录", key="show_all_history"):
+                                visible_history = image_history
+                        
                         # 显示历史记录
                         history_cols = st.columns(3)
                         
-                        for i, hist_item in enumerate(st.session_state["image_history"]):
+                        for i, hist_item in enumerate(visible_history):
                             col_idx = i % 3
                             with history_cols[col_idx]:
                                 if os.path.exists(hist_item["path"]):
-                                    st.image(hist_item["path"], caption=hist_item["prompt"][:20] + "...", use_container_width=True)
+                                    st.image(load_image_bytes(hist_item["path"]), caption=hist_item["prompt"][:20] + "...", use_container_width=True)
                                     
                                     # 添加重用按钮
-                                    if st.button(f"重用设置", key=f"reuse_{i}"):
-                                        st.session_state["text_prompt"] = hist_item["prompt"]
-                                        if "style" in hist_item:
-                                            # 找到对应的风格区域并设置
-                                            style_name = hist_item["style"]
-                                            if style_name in style_names[:5]:
-                                                st.session_state["last_used_style_section"] = "basic"
-                                            elif style_name in style_names[5:10]:
-                                                st.session_state["last_used_style_section"] = "art"
-                                            else:
-                                                st.session_state["last_used_style_section"] = "special"
-                                        st.experimental_rerun()
+                                    st.button(f"重用设置", key=f"reuse_{i}", on_click=reuse_history_settings, args=(hist_item,))
                         
                         # 清除历史记录按钮
-                        if st.button("清除历史记录"):
-                            st.session_state["image_history"] = []
-                            st.success("历史记录已清除")
-                            st.experimental_rerun()
+                        st.button("清除历史记录", on_click=clear_image_history)
                 
                 # 生成按钮
                 generate_text_button = st.button("生成图像", key="generate_text_button", disabled=not text_prompt)
@@ -420,127 +699,128 @@ def main():
                 generate_variation_button = st.button("生成变体", key="generate_variation_button", disabled=variation_file is None)
         
         # 侧边栏底部添加联系作者入口
-        st.markdown("---")
-        st.markdown("### 关于")
-        if st.button("📞 联系作者", key="contact_sidebar"):
-            st.session_state["show_contact"] = True
-            st.experimental_rerun()
+        st.markdown(SIDEBAR_ABOUT_MD)
+        st.button("📞 联系作者", key="contact_sidebar", on_click=open_contact)
         
         if st.button("💫 支持项目", key="support_project"):
             st.balloons()
             st.success("感谢您的支持！")
             
         # 版本信息
-        st.markdown("**版本**: v1.0.0")
-        st.markdown("**更新时间**: 2023年12月")
+        st.markdown(SIDEBAR_VERSION_MD)
             
     # 主界面
     if uploaded_file is not None:
-        # 处理上传的图片
-        image = Image.open(uploaded_file)
+        # 一次性读取上传文件的原始字节，API请求直接使用这些字节，
+        # 不再经PIL重新编码并写入临时文件
+        file_bytes = uploaded_file.getvalue()
         
-        # 显示上传的图片
-        st.image(image, caption="上传的图片", use_container_width=True)
+        # Image.open只读取文件头，像素数据在需要时才解码
+        image = Image.open(io.BytesIO(file_bytes))
         
-        # 保存图片到临时文件，使用唯一的文件名避免冲突
-        try:
-            timestamp = int(time.time())
-            random_suffix = os.urandom(4).hex()
-            temp_image_path = f"temp_image_{timestamp}_{random_suffix}.jpg"
-            
-            # 确保临时目录存在
-            temp_dir = os.path.dirname(temp_image_path)
-            if temp_dir and not os.path.exists(temp_dir):
-                os.makedirs(temp_dir, exist_ok=True)
-                
-            # 保存图像
-            image.save(temp_image_path)
-        except Exception as e:
-            st.error(f"保存临时图像时出错: {str(e)}")
-            st.warning("将尝试使用内存中的图像进行处理...")
-            temp_image_path = None
+        # 显示上传的图片：尺寸不大时直接把原始字节交给浏览器，省去解码和重新编码；
+        # 大图缩小后显示，避免向浏览器传输完整分辨率的图像
+        if max(image.size) <= PREVIEW_MAX_SIZE:
+            st.image(file_bytes, caption="上传的图片", use_container_width=True)
+        else:
+            st.image(decode_preview(file_bytes), caption="上传的图片", use_container_width=True)
         
         # 分析按钮被点击且有任务被选择
         if st.session_state.get("analyze_button", False) and selected_tasks:
-            # 生成唯一的处理标识符
             if uploaded_file is not None:
-                # 生成一个基于文件内容和选定任务的唯一标识符
-                file_content = uploaded_file.getvalue()
-                image_hash = hash(file_content)
-                tasks_hash = hash(tuple(sorted(selected_tasks)))
-                process_id = f"{image_hash}_{tasks_hash}"
-                
-                # 检查是否已经处理过这张图像与这些任务的组合
-                if "processed_images" not in st.session_state:
-                    st.session_state["processed_images"] = {}
-                
-                # 如果这个组合已经被处理过，跳过处理
-                if process_id in st.session_state["processed_images"]:
-                    # 直接显示之前的结果
-                    results = st.session_state["processed_images"][process_id]
-                else:
+                # 图像内容摘要，作为会话结果和API结果缓存键的一部分
+                image_digest = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+                task_prompts = {task: custom_prompt.get(task) or "" for task in selected_tasks}
+                
+                # 同一图像的结果按任务保存在会话中（任务 -> (提示, 结果)），
+                # 增加任务或修改某个任务的提示后，只处理这些任务
+                image_results = st.session_state.setdefault("results_by_image", {}).setdefault(image_digest, {})
+                
+                # 失败的任务按(任务 -> (提示, 失败提示))单独记录，不写入结果；自动分析引发的重新运行不再重复请求，
+                # 只有手动点击"开始分析"或修改该任务的提示时才重新处理
+                image_failures = st.session_state.setdefault("failed_by_image", {}).setdefault(image_digest, {})
+                if not auto_analyze:
+                    image_failures.clear()
+                
+                pending_tasks = [
+                    task for task in selected_tasks
+                    if (task not in image_results or image_results[task][0] != task_prompts[task])
+                    and (task not in image_failures or image_failures[task][0] != task_prompts[task])
+                ]
+                
+                if pending_tasks:
                     # 进行新的处理
                     with st.spinner("正在分析图像..."):
-                        # 创建API实例
-                        api = QwenAPI()
+                        # 过大的图片缩小后再提交，摘要仍按原始字节计算
+                        api_image_bytes = prepare_api_image(file_bytes)
                         
-                        # 创建一个标志来表示已经进行了处理，而不是直接修改按钮状态
-                        analysis_processed_key = "analysis_processed_" + str(int(time.time()))
-                        st.session_state[analysis_processed_key] = True
+                        # 存储本次处理的结果
+                        new_results = {}
                         
-                        # 存储所有结果
-                        results = {}
+                        # 进度条按实际完成的任务推进
+                        progress_bar = st.progress(0)
                         
-                        # 对每个选定的任务进行处理
-                        for task in selected_tasks:
+                        # 开启合并请求且有多个任务时先尝试合并为一次请求，图片只上传一次
+                        if MULTI_TASK_BATCH and len(pending_tasks) > 1:
+                            tasks_key = tuple(pending_tasks)
                             try:
-                                if temp_image_path is None:
-                                    # 如果临时文件保存失败，则使用内存中的图像
-                                    image_bytes = io.BytesIO()
-                                    image.save(image_bytes, format="JPEG")
-                                    image_bytes.seek(0)
-                                    
-                                    # 使用自定义提示
-                                    if custom_prompt.get(task):
-                                        task_result = api.process_image_request(
-                                            image_data=image_bytes.getvalue(),
-                                            task_type=task,
-                                            custom_prompt=custom_prompt[task]
-                                        )
-                                    else:
-                                        # 使用默认提示
-                                        task_result = api.process_image_request(
-                                            image_data=image_bytes.getvalue(),
-                                            task_type=task
-                                        )
-                                else:
-                                    # 使用临时文件路径
-                                    if custom_prompt.get(task):
-                                        # 使用自定义提示
-                                        task_result = api.process_image_request(
-                                            image_path=temp_image_path,
-                                            task_type=task,
-                                            custom_prompt=custom_prompt[task]
-                                        )
-                                    else:
-                                        # 使用默认提示
-                                        task_result = api.process_image_request(
-                                            image_path=temp_image_path,
-                                            task_type=task
-                                        )
+                                new_results.update(cached_process_image_multi(
+                                    image_digest,
+                                    tasks_key,
+                                    tuple(task_prompts[task] for task in tasks_key),
+                                    api_image_bytes
+                                ))
                             except Exception as e:
-                                st.error(f"处理任务 '{task}' 时出错: {str(e)}")
-                                task_result = f"处理失败: {str(e)}"
-                            
-                            # 解析API响应以获取文本内容
-                            if isinstance(task_result, dict) or isinstance(task_result, str):
-                                task_result = handle_api_response(task_result, f"处理{task}任务失败")
+                                logger.info("多任务合并请求失败，改为逐个任务请求: %s", e)
+                            progress_bar.progress(len(new_results) / len(pending_tasks))
+                        
+                        # 合并请求未覆盖的任务（未开启合并、单任务或合并失败时）逐个并发请求
+                        single_tasks = [task for task in pending_tasks if task not in new_results]
+                        
+                        # 各任务的API请求都是网络I/O，并发提交以缩短总等待时间；
+                        # Streamlit调用只在主线程中进行
+                        with ThreadPoolExecutor(max_workers=max(1, min(len(single_tasks), MAX_ANALYSIS_WORKERS))) as executor:
+                            futures = {
+                                executor.submit(
+                                    cached_process_image_request,
+                                    image_digest,
+                                    task,
+                                    task_prompts[task],
+                                    api_image_bytes
+                                ): task
+                                for task in single_tasks
+                            }
                             
-                            # 存储结果
-                            results[task] = task_result
+                            for completed, future in enumerate(as_completed(futures), start=1):
+                                task = futures[future]
+                                try:
+                                    task_result = future.result()
+                                except Exception as e:
+                                    st.error(f"处理任务 '{task}' 时出错: {str(e)}")
+                                    image_failures[task] = (task_prompts[task], f"处理失败: {str(e)}")
+                                else:
+                                    # 解析API响应以获取文本内容，无法解析时返回失败提示
+                                    failure_message = f"处理{task}任务失败"
+                                    task_result = handle_api_response(task_result, failure_message)
+                                    if task_result == failure_message:
+                                        image_failures[task] = (task_prompts[task], task_result)
+                                    else:
+                                        new_results[task] = task_result
+                                progress_bar.progress((len(pending_tasks) - len(single_tasks) + completed) / len(pending_tasks))
                         
-                        # 保存处理结果以备后用
-                        st.session_state["processed_images"][process_id] = results
+                        progress_bar.empty()
+                        
+                        # 只保存成功的处理结果以备后用
+                        for task, task_result in new_results.items():
+                            image_results[task] = (task_prompts[task], task_result)
+                            image_failures.pop(task, None)
+                
+                # 只显示当前选择的任务（当前提示下失败的任务显示失败提示）
+                results = {task: image_results[task][1] for task in selected_tasks if task in image_results}
+                results.update(
+                    (task, failure) for task, (prompt, failure) in image_failures.items()
+                    if task in task_prompts and prompt == task_prompts[task]
+                )
                 
                 # 显示结果
                 st.markdown('<h2 class="task-header">分析结果</h2>', unsafe_allow_html=True)
@@ -553,45 +833,51 @@ def main():
                         # 下载按钮
                         download_button(results["识别"], "图像识别结果.txt", "下载识别结果")
                         
-                        # 分析识别结果
-                        food_items, products = analyze_description(results["识别"])
+                        # 分析识别结果，得到(类型, 名称)
+                        kind, name = analyze_description(results["识别"])
                         
                         # 显示食物信息（如果有）
-                        if food_items:
-                            st.markdown('<div class="food-section">', unsafe_allow_html=True)
-                            st.markdown("#### 🍎 食物热量信息")
-                            
-                            for food in food_items:
+                        if kind == "food":
+                            food = name
+                            with st.container(border=True):
+                                st.markdown("#### 🍎 食物热量信息")
                                 food_info = get_food_calories(food)
-                                
+                            
                                 # 检查返回值是否为字典类型
                                 if isinstance(food_info, dict):
                                     calories = food_info.get("热量")
                                     description = food_info.get("描述", "")
-                                    
+                                
                                     if calories:
-                                        st.markdown(f"**{food}**: {calories} 千卡/100克")
-                                        
-                                        # 如果有更详细的描述，显示它
+                                        # 热量和更详细的描述（如果有）合并为一次输出
+                                        food_md = f"**{food}**: {calories} 千卡/100克"
                                         if description and description != f"{food}平均每100克含有{calories}千卡热量":
-                                            st.caption(description)
-                                            
+                                            # 转义方括号，避免描述中的"]"提前结束颜色标记
+                                            escaped = description.replace("\\", "\\\\").replace("[", "\\[").replace("]", "\\]")
+                                            food_md += f"  \n:gray[{escaped}]"
+                                        st.markdown(food_md)
+                                        
                                         # 如果有营养素信息，显示它
                                         if "营养素" in food_info:
                                             with st.expander(f"查看「{food}」的营养素信息"):
-                                                for nutrient, value in food_info["营养素"].items():
-                                                    st.markdown(f"**{nutrient}**: {value}克")
-                                        
+                                                st.markdown("  \n".join(
+                                                    f"**{nutrient}**: {value}克"
+                                                    for nutrient, value in food_info["营养素"].items()
+                                                ))
+                                    
                                         # 显示类似食物
                                         similar_foods = get_similar_foods(food)
                                         if similar_foods:
                                             with st.expander(f"查看类似于「{food}」的食物"):
                                                 if isinstance(similar_foods, dict):
-                                                    for similar_food, similar_calories in similar_foods.items():
-                                                        st.markdown(f"**{similar_food}**: {similar_calories} 千卡")
+                                                    st.markdown("  \n".join(
+                                                        f"**{similar_food}**: {similar_calories} 千卡"
+                                                        for similar_food, similar_calories in similar_foods.items()
+                                                    ))
                                                 elif isinstance(similar_foods, list):
-                                                    for similar_food in similar_foods:
-                                                        st.markdown(f"**{similar_food}**")
+                                                    st.markdown("  \n".join(
+                                                        f"**{similar_food}**" for similar_food in similar_foods
+                                                    ))
                                     else:
                                         st.markdown(f"**{food}**: 未找到热量信息")
                                 else:
@@ -601,142 +887,96 @@ def main():
                                         st.markdown(f"**{food}**: {calories} 千卡/{unit}")
                                     else:
                                         st.markdown(f"**{food}**: 未找到热量信息")
-                            
-                            st.markdown('</div>', unsafe_allow_html=True)
                         
                         # 显示商品信息（如果有）
-                        if products:
-                            st.markdown('<div class="product-section">', unsafe_allow_html=True)
-                            st.markdown("#### 🛒 商品购买链接")
-                            
-                            for product in products:
-                                links = generate_purchase_links(product)
-                                st.markdown(f"**{product}**")
-                                for platform, link in links.items():
-                                    st.markdown(f"[{platform}]({link})")
-                            
-                            st.markdown('</div>', unsafe_allow_html=True)
-                
-                # 显示作文结果（如果有）
-                if "作文" in results:
-                    with st.expander("📝 看图写作文", expanded=True):
-                        st.markdown(f'<div class="result-box"><div class="essay-content">{results["作文"]}</div></div>', unsafe_allow_html=True)
-                        
-                        # 下载按钮
-                        download_button(results["作文"], "看图作文.txt", "下载作文")
-                
-                # 显示解题结果（如果有）
-                if "解题" in results:
-                    with st.expander("🧮 看图解题", expanded=True):
-                        st.markdown(f'<div class="result-box"><div class="problem-solution">{results["解题"]}</div></div>', unsafe_allow_html=True)
-                        
-                        # 下载按钮
-                        download_button(results["解题"], "题目解答.txt", "下载解答")
+                        if kind == "product":
+                            with st.container(border=True):
+                                st.markdown(render_products_markdown((name,)))
                 
-                # 显示创意内容（故事、诗歌、科普）
-                for task in ["故事", "诗歌", "科普"]:
+                # 显示文本类任务结果（作文、解题及故事、诗歌、科普）
+                for task, (title, box_class, content_class, filename, button_text) in TEXT_RESULT_SECTIONS.items():
                     if task in results:
-                        task_titles = {
-                            "故事": "📚 生成故事",
-                            "诗歌": "🎭 创作诗歌",
-                            "科普": "🔬 科普解释"
-                        }
-                        
-                        with st.expander(task_titles[task], expanded=True):
-                            st.markdown(f'<div class="result-box creative-section"><div class="essay-content">{results[task]}</div></div>', unsafe_allow_html=True)
+                        with st.expander(title, expanded=True):
+                            st.markdown(f'<div class="{box_class}"><div class="{content_class}">{results[task]}</div></div>', unsafe_allow_html=True)
                             
                             # 下载按钮
-                            download_button(results[task], f"{task_titles[task].split()[1]}.txt", f"下载{task}")
-                
-                # 如果这是新处理的结果，完成后删除临时文件
-                if process_id not in st.session_state.get("processed_images", {}) or process_id == st.session_state.get("last_processed_id"):
-                    if temp_image_path and os.path.exists(temp_image_path):
-                        try:
-                            os.remove(temp_image_path)
-                            print(f"临时文件 {temp_image_path} 已删除")
-                        except Exception as e:
-                            print(f"删除临时文件出错: {str(e)}")
-                
-                # 记录最后处理的ID
-                st.session_state["last_processed_id"] = process_id
+                            download_button(results[task], filename, button_text)
 
     # 处理图像生成
+    # 侧边栏控件已在本次运行中写入会话状态，一次性读取快照，后续参数读取不再经过SessionState代理
+    state = dict(st.session_state)
+    
     # 文本到图像生成
-    if st.session_state.get("generation_mode") == "文本生成图像" and st.session_state.get("generate_text_button", False):
-        if st.session_state.get("text_prompt"):
+    if state.get("generation_mode") == "文本生成图像" and state.get("generate_text_button", False):
+        if state.get("text_prompt"):
             with st.spinner("正在生成图像..."):
-                # 创建一个标志来表示已经进行了处理，而不是直接修改按钮状态
-                text_processed_key = "text_processed_" + str(int(time.time()))
-                st.session_state[text_processed_key] = True
-                
                 # 获取参数
-                prompt = st.session_state.get("text_prompt")
+                prompt = state.get("text_prompt")
                 
                 # 根据最后使用的按钮决定使用哪个风格
-                if "last_used_style_section" not in st.session_state:
-                    # 默认使用基础风格
-                    style = selected_style
-                elif st.session_state["last_used_style_section"] == "art":
-                    style = selected_style2
-                elif st.session_state["last_used_style_section"] == "special":
-                    style = selected_style3
-                else:
-                    style = selected_style
+                # 默认使用基础风格
+                style = style_by_section.get(state.get("last_used_style_section"), selected_style)
                 
                 # 获取其他参数
-                quality = st.session_state.get("selected_quality", "标准")
+                quality = state.get("selected_quality", "标准")
                 aspect_ratio = selected_ratio
-                negative_prompt = st.session_state.get("negative_prompt")
-                use_mock = st.session_state.get("use_mock", False)
+                negative_prompt = state.get("negative_prompt")
+                use_mock = state.get("use_mock", False)
                 
-                # 获取选择的增强器
-                selected_enhancers = []
-                for enhancer_name in get_prompt_enhancers().keys():
-                    if st.session_state.get(f"enhancer_{enhancer_name}", False):
-                        selected_enhancers.append(enhancer_name)
+                # 选择的增强器（selected_enhancers）已在本次运行的侧边栏中由复选框收集，直接复用
                 
                 # 使用随机种子或指定种子
-                if st.session_state.get("use_random_seed", True):
+                if state.get("use_random_seed", True):
                     seed = None
                 else:
-                    seed = st.session_state.get("seed", 42)
+                    seed = state.get("seed", 42)
+                
+                # 获取生成器实例
+                generator = get_image_generator()
                 
-                # 创建生成器实例
-                generator = ImageGenerator()
+                # 指定种子时相同参数的结果是确定的：与上一次生成的参数相同且文件仍在时直接复用，
+                # 避免重复点击产生重复的付费API调用（随机种子时每次点击都期望得到新图像）
+                generation_key = (prompt, style, quality, aspect_ratio, negative_prompt,
+                                  tuple(selected_enhancers), seed, use_mock)
+                last_key, last_path = state.get("last_generation", (None, None))
+                reuse_last = seed is not None and last_key == generation_key and last_path and os.path.exists(last_path)
                 
                 try:
                     # 生成图像
-                    generated_image_path = generator.generate_from_text(
-                        prompt=prompt,
-                        style=style,
-                        quality=quality,
-                        aspect_ratio=aspect_ratio,
-                        negative_prompt=negative_prompt,
-                        seed=seed,
-                        enhancers=selected_enhancers,
-                        use_mock=use_mock
-                    )
+                    if reuse_last:
+                        generated_image_path = last_path
+                    else:
+                        generated_image_path = generator.generate_from_text(
+                            prompt=prompt,
+                            style=style,
+                            quality=quality,
+                            aspect_ratio=aspect_ratio,
+                            negative_prompt=negative_prompt,
+                            seed=seed,
+                            enhancers=selected_enhancers,
+                            use_mock=use_mock
+                        )
+                        st.session_state["last_generation"] = (generation_key, generated_image_path)
                     
                     # 显示生成的图像
                     st.markdown('<h2 class="task-header">生成结果</h2>', unsafe_allow_html=True)
                     
                     if os.path.exists(generated_image_path):
-                        # 打开生成的图像
-                        generated_image = Image.open(generated_image_path)
+                        # 只读取一次图像字节，显示和下载共用，不再经PIL解码
+                        with open(generated_image_path, "rb") as img_file:
+                            generated_bytes = img_file.read()
                         
                         # 显示图像
-                        st.markdown('<div class="generated-image">', unsafe_allow_html=True)
-                        st.image(generated_image, caption=f"AI生成图像 - {style}风格", use_container_width=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
+                        with st.container(border=True):
+                            st.image(generated_bytes, caption=f"AI生成图像 - {style}风格", use_container_width=True)
                         
                         # 创建下载按钮
-                        with open(generated_image_path, "rb") as img_file:
-                            st.download_button(
-                                label="下载图像",
-                                data=img_file,
-                                file_name=os.path.basename(generated_image_path),
-                                mime="image/png"
-                            )
+                        st.download_button(
+                            label="下载图像",
+                            data=generated_bytes,
+                            file_name=os.path.basename(generated_image_path),
+                            mime="image/png"
+                        )
                         
                         # 添加到历史记录
                         history_item = {
@@ -748,8 +988,9 @@ def main():
                             "timestamp": time.time()
                         }
                         
-                        # 将新生成的图像添加到历史记录的开头
-                        st.session_state["image_history"].insert(0, history_item)
+                        # 将新生成的图像添加到历史记录的开头（复用上一次结果时不重复添加）
+                        if not reuse_last:
+                            st.session_state["image_history"].insert(0, history_item)
                         
                         # 限制历史记录数量，最多保留10条
                         if len(st.session_state["image_history"]) > 10:
@@ -792,27 +1033,25 @@ def main():
                     st.error(f"生成过程中发生错误: {str(e)}")
     
     # 处理图像变体生成
-    if st.session_state.get("generation_mode") == "图像变体生成" and st.session_state.get("generate_variation_button", False):
-        if st.session_state.get("variation_file"):
+    if state.get("generation_mode") == "图像变体生成" and state.get("generate_variation_button", False):
+        if state.get("variation_file"):
             with st.spinner("正在生成图像变体..."):
-                # 创建一个标志来表示已经进行了处理，而不是直接修改按钮状态
-                variation_processed_key = "variation_processed_" + str(int(time.time()))
-                st.session_state[variation_processed_key] = True
-                
                 # 获取上传的图像
-                variation_file = st.session_state.get("variation_file")
-                variation_image = Image.open(variation_file)
+                variation_file = state.get("variation_file")
                 
-                # 保存到临时文件
-                temp_variation_path = "temp_variation_image.jpg"
-                variation_image.save(temp_variation_path)
+                # 上传的原始字节直接写入本次请求独有的临时文件，不经PIL重新编码；
+                # 独有路径避免多个会话同时写入同一文件
+                suffix = os.path.splitext(variation_file.name)[1] or ".jpg"
+                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+                    temp_file.write(variation_file.getbuffer())
+                    temp_variation_path = temp_file.name
                 
                 # 获取参数
-                variation_strength = st.session_state.get("variation_strength", 0.7)
-                use_mock = st.session_state.get("use_mock_variation", False)
+                variation_strength = state.get("variation_strength", 0.7)
+                use_mock = state.get("use_mock_variation", False)
                 
-                # 创建生成器实例
-                generator = ImageGenerator()
+                # 获取生成器实例
+                generator = get_image_generator()
                 
                 try:
                     # 生成变体
@@ -830,87 +1069,49 @@ def main():
                     
                     with col1:
                         st.markdown("**原始图像**")
-                        st.image(variation_image, use_container_width=True)
+                        st.image(variation_file.getvalue(), use_container_width=True)
                     
                     with col2:
                         if os.path.exists(variation_image_path):
                             st.markdown("**变体图像**")
                             
-                            # 打开生成的变体图像
-                            result_image = Image.open(variation_image_path)
-                            st.image(result_image, use_container_width=True)
+                            # 只读取一次变体图像字节，显示和下载共用
+                            with open(variation_image_path, "rb") as img_file:
+                                variation_bytes = img_file.read()
+                            st.image(variation_bytes, use_container_width=True)
                             
                             # 创建下载按钮
-                            with open(variation_image_path, "rb") as img_file:
-                                st.download_button(
-                                    label="下载变体图像",
-                                    data=img_file,
-                                    file_name=os.path.basename(variation_image_path),
-                                    mime="image/png"
-                                )
+                            st.download_button(
+                                label="下载变体图像",
+                                data=variation_bytes,
+                                file_name=os.path.basename(variation_image_path),
+                                mime="image/png"
+                            )
                         else:
                             st.error("变体生成失败，请重试。")
-                    
-                    # 完成后删除临时文件
-                    if os.path.exists(temp_variation_path):
-                        os.remove(temp_variation_path)
                 
                 except Exception as e:
                     st.error(f"生成过程中发生错误: {str(e)}")
-                    if os.path.exists(temp_variation_path):
+                finally:
+                    # 完成后删除临时文件
+                    try:
                         os.remove(temp_variation_path)
+                    except OSError:
+                        pass
     
-    # 提供使用说明
-    with st.expander("使用说明"):
-        st.markdown("""
-        ## 功能介绍
-        
-        ### 图像分析功能
-        - **图像识别与描述**: 识别并详细描述图像内容，包括食物热量和商品信息
-        - **看图写作文**: 根据图像内容自动生成不少于300字的作文
-        - **看图解题**: 识别图像中的题目并给出详细解答
-        - **创意内容生成**: 可生成与图像相关的故事、诗歌或科普解释
-        
-        ### AI绘画功能
-        - **文本生成图像**: 根据文字描述生成图像，支持15种艺术风格
-        - **图像变体生成**: 基于上传的图像创建不同风格的变体
-        - **多样风格**: 从写实、油画、水彩到二次元、赛博朋克等多种风格
-        - **质量选择**: 支持标准、高清、超清多种分辨率
-        
-        ## 使用技巧
-        1. 在进行图像分析时，可以同时选择多个任务一次性完成
-        2. 生成图像时，尝试添加详细的描述和风格，会得到更好的效果
-        3. 使用自定义提示来引导AI生成更符合期望的内容
-        4. 高级选项中的负面提示词可以帮助排除不需要的元素
-        """)
+    # 提供使用说明和API密钥设置指南；折叠的展开器仍会发送内容，
+    # 改为勾选后才输出，平时每次重新运行不再传输这两段静态文本
+    if st.checkbox("📖 显示使用说明", key="show_usage"):
+        with st.container(border=True):
+            st.markdown(HELP_MD)
     
-    # 添加API密钥设置指南
-    with st.expander("API设置"):
-        st.markdown("""
-        ### API密钥设置
-        
-        本应用使用两个API：
-        1. **通义千问API**: 用于图像识别、作文生成和解题
-        2. **Stability AI API**: 用于AI图像生成
-        
-        #### 设置方法：
-        1. 创建一个`.env`文件在应用根目录
-        2. 添加以下内容：
-           ```
-           QWEN_API_KEY=你的通义千问API密钥
-           STABILITY_API_KEY=你的Stability AI API密钥
-           ```
-        3. 如果没有Stability API密钥，应用将使用模拟模式生成图像
-        
-        #### 获取API密钥：
-        - 通义千问API密钥: [阿里云通义平台](https://dashscope.aliyun.com/)
-        - Stability AI API密钥: [Stability AI官网](https://stability.ai/)
-        """)
+    if st.checkbox("🔑 显示API设置", key="show_api_settings"):
+        with st.container(border=True):
+            st.markdown(API_SETTINGS_MD)
     
     # 显示联系作者对话框
     if st.session_state.get("show_contact", False):
-        with st.container():
-            st.markdown('<div class="contact-container">', unsafe_allow_html=True)
+        with st.container(border=True):
             st.markdown('<h2 class="contact-header">📬 联系作者</h2>', unsafe_allow_html=True)
             contact_cols = st.columns([2, 1])
             
@@ -927,7 +1128,6 @@ def main():
                 """)
                 
                 # 提交反馈的表单
-                st.markdown('<div class="contact-form">', unsafe_allow_html=True)
                 with st.form(key="feedback_form"):
                     st.markdown("### 提交反馈")
                     feedback_name = st.text_input("您的称呼（选填）")
@@ -947,23 +1147,25 @@ def main():
                         # 可以添加保存反馈到本地文件的代码
                         try:
                             feedback_dir = "feedback"
-                            if not os.path.exists(feedback_dir):
-                                os.makedirs(feedback_dir)
+                            os.makedirs(feedback_dir, exist_ok=True)
                                 
                             feedback_time = time.strftime("%Y%m%d-%H%M%S")
                             feedback_file = f"{feedback_dir}/feedback_{feedback_time}.txt"
                             
+                            # 整条反馈拼接好后一次写入
+                            feedback_text = (
+                                f"时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                                f"姓名: {feedback_name}\n"
+                                f"邮箱: {feedback_email}\n"
+                                f"类型: {feedback_type}\n"
+                                f"内容:\n{feedback_content}\n"
+                            )
                             with open(feedback_file, "w", encoding="utf-8") as f:
-                                f.write(f"时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                                f.write(f"姓名: {feedback_name}\n")
-                                f.write(f"邮箱: {feedback_email}\n")
-                                f.write(f"类型: {feedback_type}\n")
-                                f.write(f"内容:\n{feedback_content}\n")
+                                f.write(feedback_text)
                                 
                             st.info(f"反馈已保存到 {feedback_file}")
                         except Exception as e:
                             st.warning(f"保存反馈时出错: {str(e)}")
-                st.markdown('</div>', unsafe_allow_html=True)
             
             with contact_cols[1]:
                 # 添加二维码或头像图片
@@ -971,28 +1173,16 @@ def main():
                 st.markdown("![联系二维码](https://via.placeholder.com/200x200?text=扫码联系)")
                 
                 # 关闭按钮
-                if st.button("关闭", key="close_contact"):
-                    st.session_state["show_contact"] = False
-                    st.experimental_rerun()
-                    st.markdown('</div>', unsafe_allow_html=True)
+                st.button("关闭", key="close_contact", on_click=close_contact)
         
     # 添加页脚
     st.markdown("""
     <div class="footer">
         <p>© 2025 通义千问视觉智能助手 | 
-           <a href="javascript:void(0);" onclick="document.dispatchEvent(new CustomEvent('contact_author'))">联系作者</a> | 
            <a href="https://github.com/drizzle72/qwen-vision-app" target="_blank">GitHub</a> | 
            <a href="https://dashscope.aliyun.com/" target="_blank">通义千问API</a>
         </p>
     </div>
-    
-    <script>
-        document.addEventListener('contact_author', function() {
-            // 通过按钮点击事件触发联系作者
-            const contactBtn = document.querySelector('button[data-testid="baseButton-secondary"]');
-            if (contactBtn) contactBtn.click();
-        });
-    </script>
     """, unsafe_allow_html=True)
 
 if __name__ == "__main__":
@@ -5,10 +5,14 @@ DEEPSEEK API接口模块
 """
 
 import os
+import mmap
 import base64
 import requests
 from dotenv import load_dotenv
 
+# 描述分析沿用通义千问模块的实现（共用预编译的关键词和名称正则），在此重新导出
+from qwen_api import analyze_description
+
 # 加载环境变量
 load_dotenv()
 
@@ -32,6 +36,15 @@ class DeepseekAPI:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        
+        # 复用HTTP连接（keep-alive），避免每次请求都重新进行TCP/TLS握手
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    
+    def close(self):
+        """关闭复用的HTTP连接"""
+        self.session.close()
     
     def encode_image(self, image_path):
         """
@@ -43,8 +56,14 @@ class DeepseekAPI:
         返回:
             str: base64编码的图片字符串
         """
+        # 空文件无法建立内存映射，直接返回空字符串
+        if os.path.getsize(image_path) == 0:
+            return ""
+        
+        # 通过内存映射直接编码文件内容，不再先把整个文件读入一份bytes副本
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return base64.b64encode(mapped).decode('utf-8')
     
     def identify_image(self, image_path=None, image_base64=None):
         """
@@ -88,7 +107,7 @@ class DeepseekAPI:
         }
         
         try:
-            response = requests.post(endpoint, json=payload, headers=self.headers)
+            response = self.session.post(endpoint, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -161,51 +180,3 @@ class DeepseekAPI:
             return response["choices"][0]["message"]["content"]
         except (KeyError, IndexError):
             return "无法解析API响应"
-        
-def analyze_description(description):
-    """
-    分析描述文本，判断图片内容类型
-    
-    参数:
-        description (str): 图片描述文本
-        
-    返回:
-        tuple: (类型, 名称) 如 ("food", "宫保鸡丁") 或 ("product", "iPhone")
-    """
-    # 食物相关关键词
-    food_keywords = ["食物", "美食", "菜", "餐", "吃的", "食品", "零食", "小吃", "甜点", 
-                     "水果", "蔬菜", "肉", "鱼", "饭", "面", "汤", "饮料", "早餐", "午餐", "晚餐"]
-    
-    # 商品相关关键词
-    product_keywords = ["产品", "商品", "物品", "设备", "装置", "器械", "工具", "家电", 
-                       "电子产品", "手机", "电脑", "相机", "服装", "鞋", "包", "家具"]
-    
-    # 检查是否是食物
-    for keyword in food_keywords:
-        if keyword in description:
-            # 尝试提取食物名称
-            import re
-            food_matches = re.findall(r'(?:是|像|为|叫)([^，。,\.]+?)(?:，|。|,|\.|$)', description)
-            if food_matches:
-                for match in food_matches:
-                    if len(match) < 20 and len(match) > 1:  # 避免提取过长或过短的名称
-                        return "food", match.strip()
-            
-            # 如果没有明确提取出名称，返回一个通用描述
-            return "food", description[:20] + "..." if len(description) > 20 else description
-    
-    # 检查是否是商品
-    for keyword in product_keywords:
-        if keyword in description:
-            # 尝试提取商品名称
-            import re
-            product_matches = re.findall(r'(?:是|像|为|叫)([^，。,\.]+?)(?:，|。|,|\.|$)', description)
-            if product_matches:
-                for match in product_matches:
-                    if len(match) < 20 and len(match) > 1:
-                        return "product", match.strip()
-            
-            return "product", description[:20] + "..." if len(description) > 20 else description
-    
-    # 如果无法确定类型
-    return "unknown", description[:20] + "..." if len(description) > 20 else description 
\ No newline at end of file
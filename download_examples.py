@@ -8,21 +8,22 @@ import os
 import requests
 from tqdm import tqdm
 
-def download_file(url, filename):
+def download_file(url, filename, session=None):
     """
     从URL下载文件
     
     参数:
         url (str): 文件URL
         filename (str): 保存的文件名
+        session (requests.Session, optional): 复用连接的会话，不提供时单独发起请求
     """
-    response = requests.get(url, stream=True)
-    total_size = int(response.headers.get('content-length', 0))
-    
     if os.path.exists(filename):
         print(f"{filename} 已存在，跳过下载。")
         return
     
+    response = (session or requests).get(url, stream=True)
+    total_size = int(response.headers.get('content-length', 0))
+    
     with open(filename, 'wb') as file, tqdm(
         desc=filename,
         total=total_size,
@@ -45,8 +46,11 @@ def main():
         "example_other.jpg": "https://images.unsplash.com/photo-1505144808419-1957a94ca61e"
     }
     
-    for filename, url in examples.items():
-        download_file(url, filename)
+    # 示例图片来自同一主机，复用一个会话的连接池，只需进行一次TCP/TLS握手
+    with requests.Session() as session:
+        session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        for filename, url in examples.items():
+            download_file(url, filename, session=session)
     
     print("所有示例图片下载完成！")
     print("运行 'streamlit run app.py' 启动应用")
@@ -17,15 +17,41 @@ import numpy as np
 import json
 from PIL import ImageDraw, ImageFont
 import re
-from scipy.ndimage import gaussian_filter
+import logging
 
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 创建图像存储目录
 GENERATED_IMAGES_DIR = "generated_images"
 os.makedirs(GENERATED_IMAGES_DIR, exist_ok=True)
 
+# 生成目录中最多保留的图像数量，超过时删除最旧的文件，避免目录无限增长
+MAX_GENERATED_IMAGES = 100
+
+def prune_generated_images(max_files=MAX_GENERATED_IMAGES):
+    """
+    按修改时间删除生成目录中最旧的图像，只保留最新的max_files个
+    
+    参数:
+        max_files (int): 最多保留的文件数量
+    """
+    try:
+        entries = [entry for entry in os.scandir(GENERATED_IMAGES_DIR) if entry.is_file()]
+    except OSError:
+        return
+    if len(entries) <= max_files:
+        return
+    
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - max_files]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
 # 图像生成API配置
 STABILITY_API_KEY = os.getenv("STABILITY_API_KEY")  # Stability AI API密钥
 STABILITY_API_BASE = "https://api.stability.ai/v1/generation"  # 更新为最新的API基础URL
@@ -87,7 +113,14 @@ class ImageGenerator:
         """
         self.stability_api_key = api_key or STABILITY_API_KEY
         if not self.stability_api_key:
-            print("警告: 未提供Stability API密钥，将使用模拟生成模式")
+            logger.warning("未提供Stability API密钥，将使用模拟生成模式")
+        
+        # 复用HTTP连接（keep-alive），连续生成时不再重复进行TCP/TLS握手
+        self.session = requests.Session()
+    
+    def close(self):
+        """关闭复用的HTTP连接"""
+        self.session.close()
             
     def generate_from_text(self, prompt, style=None, quality="标准", aspect_ratio="1:1 方形", 
                           negative_prompt=None, seed=None, enhancers=None, use_mock=False):
@@ -166,7 +199,7 @@ class ImageGenerator:
             try:
                 return self._call_stability_api(english_prompt, negative_prompt, quality_params, seed)
             except Exception as e:
-                print(f"API调用失败，切换到模拟模式: {e}")
+                logger.warning("API调用失败，切换到模拟模式: %s", e)
                 return self._mock_generate_image(prompt, style, quality_params, seed)
     
     def create_image_variation(self, image_path, variation_strength=0.7, use_mock=False):
@@ -189,7 +222,7 @@ class ImageGenerator:
                 # 由于Stability AI API变体生成较复杂，这里我们用模拟实现
                 return self._mock_image_variation(image_path, variation_strength)
             except Exception as e:
-                print(f"API调用失败，切换到模拟模式: {e}")
+                logger.warning("API调用失败，切换到模拟模式: %s", e)
                 return self._mock_image_variation(image_path, variation_strength)
     
     def _call_stability_api(self, prompt, negative_prompt, quality_params, seed):
@@ -210,15 +243,15 @@ class ImageGenerator:
             
         # 确保提示词是英文
         if not prompt.isascii():
-            print(f"原始提示词(中文): {prompt}")
+            logger.debug("原始提示词(中文): %s", prompt)
             prompt = self._simulate_translation(prompt)
-            print(f"转换后提示词(英文): {prompt}")
+            logger.debug("转换后提示词(英文): %s", prompt)
             
         # 确保负面提示词是英文
         if negative_prompt and not negative_prompt.isascii():
-            print(f"原始负面提示词(中文): {negative_prompt}")
+            logger.debug("原始负面提示词(中文): %s", negative_prompt)
             negative_prompt = self._simulate_translation(negative_prompt)
-            print(f"转换后负面提示词(英文): {negative_prompt}")
+            logger.debug("转换后负面提示词(英文): %s", negative_prompt)
             
         # 准备API调用
         headers = {
@@ -260,11 +293,12 @@ class ImageGenerator:
             )
             
         try:
-            print(f"正在调用Stability API: {api_url}")
-            print(f"请求参数: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+            logger.debug("正在调用Stability API: %s", api_url)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("请求参数: %s", json.dumps(payload, ensure_ascii=False, indent=2))
             
             # 调用API
-            response = requests.post(
+            response = self.session.post(
                 api_url,
                 headers=headers,
                 json=payload
@@ -273,7 +307,7 @@ class ImageGenerator:
             # 检查是否成功
             if response.status_code != 200:
                 error_msg = f"API调用失败: {response.status_code} - {response.text}"
-                print(error_msg)
+                logger.error(error_msg)
                 raise Exception(error_msg)
                 
             # 解析响应
@@ -290,21 +324,22 @@ class ImageGenerator:
                 
                 with open(output_path, "wb") as f:
                     f.write(image_data)
+                prune_generated_images()
                     
-                print(f"图像已保存到: {output_path}")
+                logger.debug("图像已保存到: %s", output_path)
                 return output_path
             else:
                 error_msg = f"API响应中未找到图像数据: {json.dumps(response_data, ensure_ascii=False)}"
-                print(error_msg)
+                logger.error(error_msg)
                 raise ValueError(error_msg)
                 
         except requests.exceptions.RequestException as e:
             error_msg = f"API请求异常: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             raise Exception(error_msg)
         except Exception as e:
             error_msg = f"处理API响应时出错: {str(e)}"
-            print(error_msg)
+            logger.error(error_msg)
             raise Exception(error_msg)
     
     def _mock_generate_image(self, prompt, style, quality_params, seed):
@@ -441,6 +476,7 @@ class ImageGenerator:
         timestamp = int(time.time())
         output_path = os.path.join(GENERATED_IMAGES_DIR, f"mock_{timestamp}_{seed}.png")
         image.save(output_path)
+        prune_generated_images()
         
         return output_path
     
@@ -474,10 +510,13 @@ class ImageGenerator:
             # 转换为numpy数组进行处理
             img_array = np.array(original_img)
             
-            # 创建基础变化
-            noise = np.random.normal(0, 30 * variation_strength, img_array.shape).astype(np.int16)
-            varied_array = np.clip(img_array.astype(np.int16) + noise, 0, 255).astype(np.uint8)
-            varied_img = Image.fromarray(varied_array)
+            # 创建基础变化：噪声直接以float32生成，缩放、叠加和截断都在同一缓冲区内原地完成，
+            # 不再产生float64噪声和两份int16临时数组
+            varied_array = np.random.default_rng().standard_normal(img_array.shape, dtype=np.float32)
+            varied_array *= 30 * variation_strength
+            varied_array += img_array
+            np.clip(varied_array, 0, 255, out=varied_array)
+            varied_img = Image.fromarray(varied_array.astype(np.uint8))
             
             # 应用图像增强
             enhancers = [
@@ -493,19 +532,19 @@ class ImageGenerator:
             
             # 应用高斯模糊
             if random.random() < 0.5:
-                img_array = np.array(varied_img)
-                blurred = gaussian_filter(img_array, sigma=variation_strength)
-                varied_img = Image.fromarray(blurred.astype(np.uint8))
+                # PIL的GaussianBlur在C中按行、列分两次一维处理，只模糊空间方向，不混合颜色通道
+                varied_img = varied_img.filter(ImageFilter.GaussianBlur(radius=variation_strength))
             
             # 保存结果
             timestamp = int(time.time())
             output_path = os.path.join(GENERATED_IMAGES_DIR, f"var_{timestamp}_{os.path.basename(image_path)}")
             varied_img.save(output_path, quality=95)
+            prune_generated_images()
             
             return output_path
         
         except Exception as e:
-            print(f"创建图像变体失败: {e}")
+            logger.error("创建图像变体失败: %s", e)
             # 如果处理失败，返回原图
             return image_path
     
@@ -6,8 +6,7 @@
 """
 
 import sys
-import json
-from qwen_api import parse_qwen_response
+from qwen_api import parse_qwen_response, load_dict_literal
 
 def parse_api_response_with_suffix(response_text):
     """
@@ -25,8 +24,8 @@ def parse_api_response_with_suffix(response_text):
         json_str = response_text.split("需要解析text")[0].strip()
         
         try:
-            # 使用eval将Python字典字符串转换为字典对象
-            parsed_dict = eval(json_str)
+            # 将Python字典字符串转换为字典对象
+            parsed_dict = load_dict_literal(json_str)
             return parse_qwen_response(parsed_dict)
         except Exception as e:
             print(f"警告: 解析响应时出错: {e}", file=sys.stderr)
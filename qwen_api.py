@@ -11,6 +11,17 @@ from dotenv import load_dotenv
 from PIL import Image
 import io
 import json
+import re
+import ast
+import logging
+
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时退回标准库json
+    orjson = json
+
+logger = logging.getLogger(__name__)
 
 # 加载环境变量
 load_dotenv()
@@ -19,6 +30,8 @@ load_dotenv()
 API_KEY = os.getenv("QWEN_API_KEY")
 # 通义千问API端点
 API_BASE = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
+# HTTP连接池大小（与应用中并发分析任务的数量相当）
+SESSION_POOL_SIZE = 8
 
 # 创建任务类型
 TASK_TYPES = {
@@ -30,6 +43,27 @@ TASK_TYPES = {
     "科普": "请根据这张图片进行详细的科普解释，介绍相关的科学知识。"
 }
 
+# 多任务合并请求的提示模板
+MULTI_TASK_PROMPT = (
+    "请根据这张图片依次完成以下任务：\n{task_list}\n"
+    "请只输出一个JSON对象，键为任务名称（{task_names}），值为对应任务的完整结果文本，不要输出其他内容。"
+)
+
+def guess_image_mime_type(image_base64):
+    """
+    根据base64数据的文件头判断图片的MIME类型
+    
+    参数:
+        image_base64 (str): base64编码的图片字符串
+        
+    返回:
+        str: MIME类型，无法识别时默认为image/jpeg
+    """
+    # PNG文件头 \x89PNG 的base64编码
+    if image_base64.startswith("iVBORw0KGgo"):
+        return "image/png"
+    return "image/jpeg"
+
 class QwenAPI:
     def __init__(self, api_key=None):
         """
@@ -46,6 +80,16 @@ class QwenAPI:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        
+        # 复用HTTP连接（keep-alive），避免每次请求都重新进行TCP/TLS握手；
+        # 连接池大小足以容纳并发执行的全部分析任务
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=SESSION_POOL_SIZE))
+    
+    def close(self):
+        """关闭复用的HTTP连接"""
+        self.session.close()
     
     def encode_image(self, image_path):
         """
@@ -63,7 +107,7 @@ class QwenAPI:
                 # 读取二进制数据并编码，不进行utf-8解码
                 return base64.b64encode(image_file.read()).decode('utf-8')
         except Exception as e:
-            print(f"编码图片时出错: {str(e)}")
+            logger.error("编码图片时出错: %s", e)
             raise
     
     def process_image_request(self, image_path=None, image_data=None, task_type="识别", custom_prompt=None):
@@ -91,7 +135,7 @@ class QwenAPI:
             try:
                 image_base64 = self.encode_image(image_path)
             except Exception as e:
-                print(f"处理图片路径时出错: {str(e)}")
+                logger.warning("处理图片路径时出错: %s", e)
                 # 如果编码失败，尝试使用PIL打开图片并重新编码
                 try:
                     # 使用PIL打开图片
@@ -116,7 +160,7 @@ class QwenAPI:
                         {
                             "role": "user",
                             "content": [
-                                {"image": f"data:image/jpeg;base64,{image_base64}"},
+                                {"image": f"data:{guess_image_mime_type(image_base64)};base64,{image_base64}"},
                                 {"text": prompt}
                             ]
                         }
@@ -124,7 +168,7 @@ class QwenAPI:
                 }
             }
             
-            response = requests.post(API_BASE, json=payload, headers=self.headers)
+            response = self.session.post(API_BASE, json=payload)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -132,6 +176,53 @@ class QwenAPI:
         except Exception as e:
             return {"error": f"处理过程中出错: {str(e)}"}
     
+    def process_image_multi(self, tasks, image_path=None, image_data=None, custom_prompts=None):
+        """
+        在一次API请求中完成多个任务，图片只需上传和编码一次
+        
+        参数:
+            tasks (list): 任务类型列表
+            image_path (str, optional): 图片文件路径
+            image_data (bytes, optional): 图片二进制数据
+            custom_prompts (dict, optional): 各任务的自定义提示，未提供的任务使用预设提示
+            
+        返回:
+            dict: 任务类型到结果文本的映射；请求失败或响应无法解析时返回None
+        """
+        custom_prompts = custom_prompts or {}
+        task_list = "\n".join(
+            f"{index}. {task}：{custom_prompts.get(task) or TASK_TYPES.get(task, TASK_TYPES['识别'])}"
+            for index, task in enumerate(tasks, start=1)
+        )
+        prompt = MULTI_TASK_PROMPT.format(task_list=task_list, task_names="、".join(tasks))
+        
+        response = self.process_image_request(
+            image_path=image_path,
+            image_data=image_data,
+            custom_prompt=prompt
+        )
+        if isinstance(response, dict) and "error" in response:
+            logger.warning("多任务请求失败: %s", response["error"])
+            return None
+        
+        # 模型可能用```json代码块包裹结果，只取最外层的JSON对象
+        text = parse_qwen_response(response)
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        # 作文、诗歌等多段落结果的字符串值中常含未转义的换行，用非严格模式解析（orjson不支持）
+        try:
+            parsed = json.loads(text[start:end + 1], strict=False)
+        except ValueError:
+            return None
+        
+        # 任何任务缺失或结果不是文本都视为解析失败，由调用方逐个任务重新请求
+        if not isinstance(parsed, dict):
+            return None
+        if not all(isinstance(parsed.get(task), str) and parsed[task].strip() for task in tasks):
+            return None
+        return {task: parsed[task] for task in tasks}
+    
     def parse_api_response(self, response):
         """
         解析API响应，提取文本内容
@@ -145,7 +236,7 @@ class QwenAPI:
         if isinstance(response, str):
             try:
                 # 尝试将字符串解析为JSON
-                response = json.loads(response)
+                response = orjson.loads(response)
             except json.JSONDecodeError:
                 # 如果不是有效的JSON，则直接返回原字符串
                 return response
@@ -183,7 +274,7 @@ class QwenAPI:
         except Exception as e:
             return f"解析响应时出错: {str(e)}"
     
-    def get_image_description(self, image_path=None, image_base64=None, use_mock=False):
+    def get_image_description(self, image_path=None, image_base64=None, use_mock=False, image_data=None):
         """
         获取图片描述
         
@@ -191,6 +282,7 @@ class QwenAPI:
             image_path (str, optional): 图片文件路径
             image_base64 (str, optional): base64编码的图片数据
             use_mock (bool): 是否使用模拟结果
+            image_data (bytes, optional): 图片二进制数据，提供时无需经过base64往返转换
             
         返回:
             str: 图片描述文本
@@ -202,14 +294,14 @@ class QwenAPI:
             try:
                 response = self.process_image_request(
                     image_path=image_path, 
-                    image_data=base64.b64decode(image_base64) if image_base64 else None,
+                    image_data=image_data or (base64.b64decode(image_base64) if image_base64 else None),
                     task_type="识别"
                 )
                 return self.parse_api_response(response)
             except Exception as e:
                 return f"API调用失败: {str(e)}"
     
-    def generate_essay(self, image_path=None, image_base64=None, custom_prompt=None):
+    def generate_essay(self, image_path=None, image_base64=None, custom_prompt=None, image_data=None):
         """
         根据图片生成作文
         
@@ -217,6 +309,7 @@ class QwenAPI:
             image_path (str, optional): 图片文件路径
             image_base64 (str, optional): base64编码的图片数据
             custom_prompt (str, optional): 自定义提示
+            image_data (bytes, optional): 图片二进制数据，提供时无需经过base64往返转换
             
         返回:
             str: 生成的作文文本
@@ -224,7 +317,7 @@ class QwenAPI:
         try:
             response = self.process_image_request(
                 image_path=image_path, 
-                image_data=base64.b64decode(image_base64) if image_base64 else None,
+                image_data=image_data or (base64.b64decode(image_base64) if image_base64 else None),
                 task_type="作文", 
                 custom_prompt=custom_prompt
             )
@@ -232,7 +325,7 @@ class QwenAPI:
         except Exception as e:
             return f"生成作文失败: {str(e)}"
     
-    def solve_problem(self, image_path=None, image_base64=None, custom_prompt=None):
+    def solve_problem(self, image_path=None, image_base64=None, custom_prompt=None, image_data=None):
         """
         根据图片解题
         
@@ -240,6 +333,7 @@ class QwenAPI:
             image_path (str, optional): 图片文件路径
             image_base64 (str, optional): base64编码的图片数据
             custom_prompt (str, optional): 自定义提示
+            image_data (bytes, optional): 图片二进制数据，提供时无需经过base64往返转换
             
         返回:
             str: 解题过程和答案
@@ -247,7 +341,7 @@ class QwenAPI:
         try:
             response = self.process_image_request(
                 image_path=image_path, 
-                image_data=base64.b64decode(image_base64) if image_base64 else None,
+                image_data=image_data or (base64.b64decode(image_base64) if image_base64 else None),
                 task_type="解题", 
                 custom_prompt=custom_prompt
             )
@@ -255,7 +349,7 @@ class QwenAPI:
         except Exception as e:
             return f"解题失败: {str(e)}"
     
-    def generate_creative_content(self, image_path=None, image_base64=None, content_type="故事", custom_prompt=None):
+    def generate_creative_content(self, image_path=None, image_base64=None, content_type="故事", custom_prompt=None, image_data=None):
         """
         根据图片生成创意内容（故事、诗歌、科普等）
         
@@ -264,6 +358,7 @@ class QwenAPI:
             image_base64 (str, optional): base64编码的图片数据
             content_type (str): 内容类型 ("故事", "诗歌", "科普")
             custom_prompt (str, optional): 自定义提示
+            image_data (bytes, optional): 图片二进制数据，提供时无需经过base64往返转换
             
         返回:
             str: 生成的创意内容
@@ -274,7 +369,7 @@ class QwenAPI:
         try:
             response = self.process_image_request(
                 image_path=image_path, 
-                image_data=base64.b64decode(image_base64) if image_base64 else None,
+                image_data=image_data or (base64.b64decode(image_base64) if image_base64 else None),
                 task_type=content_type, 
                 custom_prompt=custom_prompt
             )
@@ -282,6 +377,21 @@ class QwenAPI:
         except Exception as e:
             return f"生成{content_type}失败: {str(e)}"
 
+# 食物相关关键词
+FOOD_KEYWORDS = ["食物", "美食", "菜", "餐", "吃的", "食品", "零食", "小吃", "甜点", 
+                 "水果", "蔬菜", "肉", "鱼", "饭", "面", "汤", "饮料", "早餐", "午餐", "晚餐"]
+
+# 商品相关关键词
+PRODUCT_KEYWORDS = ["产品", "商品", "物品", "设备", "装置", "器械", "工具", "家电", 
+                    "电子产品", "手机", "电脑", "相机", "服装", "鞋", "包", "家具"]
+
+# 每类关键词预编译为一个正则，一次扫描即可判断描述中是否含有其中任意一个关键词
+FOOD_KEYWORD_RE = re.compile("|".join(map(re.escape, FOOD_KEYWORDS)))
+PRODUCT_KEYWORD_RE = re.compile("|".join(map(re.escape, PRODUCT_KEYWORDS)))
+
+# 从描述中提取名称的正则
+NAME_RE = re.compile(r'(?:是|像|为|叫)([^，。,\.]+?)(?:，|。|,|\.|$)')
+
 def analyze_description(description):
     """
     分析描述文本，判断图片内容类型
@@ -292,44 +402,41 @@ def analyze_description(description):
     返回:
         tuple: (类型, 名称) 如 ("food", "宫保鸡丁") 或 ("product", "iPhone")
     """
-    # 食物相关关键词
-    food_keywords = ["食物", "美食", "菜", "餐", "吃的", "食品", "零食", "小吃", "甜点", 
-                     "水果", "蔬菜", "肉", "鱼", "饭", "面", "汤", "饮料", "早餐", "午餐", "晚餐"]
-    
-    # 商品相关关键词
-    product_keywords = ["产品", "商品", "物品", "设备", "装置", "器械", "工具", "家电", 
-                       "电子产品", "手机", "电脑", "相机", "服装", "鞋", "包", "家具"]
-    
-    # 检查是否是食物
-    for keyword in food_keywords:
-        if keyword in description:
-            # 尝试提取食物名称
-            import re
-            food_matches = re.findall(r'(?:是|像|为|叫)([^，。,\.]+?)(?:，|。|,|\.|$)', description)
-            if food_matches:
-                for match in food_matches:
-                    if len(match) < 20 and len(match) > 1:  # 避免提取过长或过短的名称
-                        return "food", match.strip()
+    # 依次检查是否是食物、商品
+    for content_type, keyword_re in (("food", FOOD_KEYWORD_RE), ("product", PRODUCT_KEYWORD_RE)):
+        if keyword_re.search(description):
+            # 尝试提取名称
+            for match in NAME_RE.findall(description):
+                if len(match) < 20 and len(match) > 1:  # 避免提取过长或过短的名称
+                    return content_type, match.strip()
             
             # 如果没有明确提取出名称，返回一个通用描述
-            return "food", description[:20] + "..." if len(description) > 20 else description
-    
-    # 检查是否是商品
-    for keyword in product_keywords:
-        if keyword in description:
-            # 尝试提取商品名称
-            import re
-            product_matches = re.findall(r'(?:是|像|为|叫)([^，。,\.]+?)(?:，|。|,|\.|$)', description)
-            if product_matches:
-                for match in product_matches:
-                    if len(match) < 20 and len(match) > 1:
-                        return "product", match.strip()
-            
-            return "product", description[:20] + "..." if len(description) > 20 else description
+            return content_type, description[:20] + "..." if len(description) > 20 else description
     
     # 如果无法确定类型
     return "unknown", description[:20] + "..." if len(description) > 20 else description 
 
+def load_dict_literal(json_str):
+    """
+    将Python字典形式的字符串转换为字典对象
+    
+    先将单引号替换为双引号按JSON快速解析，失败时（例如文本中含有引号）
+    再使用ast.literal_eval安全解析，避免使用eval执行任意代码
+    
+    参数:
+        json_str (str): Python字典形式的字符串
+        
+    返回:
+        dict: 解析后的字典对象
+    """
+    # 字符串值中含有双引号或转义字符（如\'）时替换引号会改变内容，直接走安全解析
+    if '"' not in json_str and "\\" not in json_str:
+        try:
+            return orjson.loads(json_str.replace("'", '"'))
+        except ValueError:
+            pass
+    return ast.literal_eval(json_str)
+
 def parse_qwen_response(response_data):
     """
     解析通义千问API的响应数据，提取文本内容
@@ -355,7 +462,7 @@ def parse_qwen_response(response_data):
     if isinstance(response_data, str):
         try:
             # 尝试将字符串解析为JSON
-            response_data = json.loads(response_data)
+            response_data = orjson.loads(response_data)
         except json.JSONDecodeError:
             # 如果不是有效的JSON，则直接返回原字符串
             return response_data
@@ -6,7 +6,7 @@
 """
 
 import os
-from qwen_api import QwenAPI
+from qwen_api import QwenAPI, analyze_description, load_dict_literal
 
 def test_api():
     """测试通义千问API图像识别功能"""
@@ -37,5 +37,40 @@ def test_api():
     
     print("\n测试完成！")
 
+def test_analyze_description():
+    """测试描述分析返回(类型, 名称)二元组，名称是完整的字符串而不是名称列表"""
+    kind, name = analyze_description("图中的食物是宫保鸡丁。")
+    assert kind == "food"
+    assert name == "宫保鸡丁"
+    
+    kind, name = analyze_description("这张图片中的商品是iPhone手机。")
+    assert kind == "product"
+    assert name == "iPhone手机"
+    
+    kind, name = analyze_description("一片蓝天白云。")
+    assert kind == "unknown"
+    assert isinstance(name, str)
+
+def test_load_dict_literal():
+    """测试字典字符串解析，含有引号或转义引号时结果与ast.literal_eval一致"""
+    assert load_dict_literal("{'a': 'x', 'b': [1, 2]}") == {"a": "x", "b": [1, 2]}
+    assert load_dict_literal(r"{'a': 'it\'s'}") == {"a": "it's"}
+    assert load_dict_literal("{'a': 'he said \"hi\"'}") == {"a": 'he said "hi"'}
+
+def test_process_image_multi():
+    """测试多任务合并请求能解析代码块包裹、值中含有换行的JSON回复"""
+    api = QwenAPI(api_key="test-key")
+    reply = '```json\n{"作文": "第一段\n第二段", "诗歌": "床前明月光\n疑是地上霜"}\n```'
+    # 替换实际的网络请求，返回通义千问格式的响应
+    api.process_image_request = lambda **kwargs: {
+        "output": {"choices": [{"message": {"content": [{"text": reply}]}}]}
+    }
+    
+    results = api.process_image_multi(["作文", "诗歌"], image_data=b"image")
+    assert results == {"作文": "第一段\n第二段", "诗歌": "床前明月光\n疑是地上霜"}
+    
+    # 缺少任务的回复视为解析失败
+    assert api.process_image_multi(["作文", "诗歌", "故事"], image_data=b"image") is None
+
 if __name__ == "__main__":
     test_api() 
\ No newline at end of file